@@ -4,12 +4,68 @@ Text Cleaning Functions
 Functions for cleaning and normalizing text data.
 """
 
+import os
 import re
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
 from langdetect import detect
 import logging
 
+try:
+    import fasttext
+except ImportError:  # optional, falls back to langdetect
+    fasttext = None
+
+try:
+    import hyperscan
+except ImportError:  # optional, mask_pii_batch falls back to re
+    hyperscan = None
+
 logger = logging.getLogger(__name__)
 
+# fastText language-ID model (https://fasttext.cc/docs/en/language-identification.html),
+# resolved against the project root unless overridden with the LID_MODEL_PATH env var
+LID_MODEL_PATH = Path(os.environ.get("LID_MODEL_PATH", Path(__file__).resolve().parent.parent / "models" / "lid.176.ftz"))
+
+_EMAIL_PATTERN = r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b"
+_IP_PATTERN = r"\b(?:\d{1,3}\.){3}\d{1,3}\b"
+
+# Single alternation so each text is scanned once; emails take precedence, as before
+_PII_RE = re.compile(f"(?P<email>{_EMAIL_PATTERN})|(?P<ip>{_IP_PATTERN})")
+
+_REPL_EMAIL = "|||EMAIL|||"
+_REPL_IP = "|||IP|||"
+
+def _pii_repl(match: re.Match) -> str:
+    return _REPL_EMAIL if match.lastgroup == "email" else _REPL_IP
+
+def _compile_pii_db():
+    """
+    Compile the PII patterns into a Hyperscan (SIMD DFA) database if hyperscan is available.
+
+    Returns:
+        The compiled database, or None to fall back to re.
+    """
+
+    if hyperscan is None:
+        return None
+
+    try:
+        db = hyperscan.Database()
+        db.compile(
+            expressions=[_EMAIL_PATTERN.encode(), _IP_PATTERN.encode()],
+            ids=[0, 1],
+            elements=2,
+            flags=[hyperscan.HS_FLAG_SINGLEMATCH] * 2,
+        )
+        return db
+    except Exception as e:
+        logger.warning("Failed to compile Hyperscan PII database, using re: %s", e)
+        return None
+
+_PII_DB = _compile_pii_db()
+
 def mask_pii(text: str) -> str:
     """
     Mask personally identifiable information (PII) in the text.
@@ -20,15 +76,99 @@ def mask_pii(text: str) -> str:
     Returns:
         str: The text with emails and IPv4 addresses masked.
     """
-    
-    text = re.sub(r"[A-Za-z0-9._-]+@[A-Za-z0-9._-]+\.[A-Za-z]{2,}", "|||EMAIL|||", text)
-    text = re.sub(r"\b(?:\d{1,3}\.){3}\d{1,3}\b", "|||IP|||", text)
 
-    return text
+    # Both patterns need a ".", so a cheap substring check lets most clean text skip the regex engine
+    if "." not in text:
+        return text
+
+    return _PII_RE.sub(_pii_repl, text)
+
+def _may_contain_pii(text: str) -> bool:
+    """
+    Hyperscan pre-scan: False only if the text certainly has no email or IPv4 match.
+    """
+
+    # Hyperscan matches bytes with ASCII \b and \d, while re uses Unicode semantics on str,
+    # so only ASCII texts can be ruled out by the scan
+    if not text.isascii():
+        return True
+
+    found = False
+
+    def on_match(id, start, end, flags, context):
+        nonlocal found
+        found = True
+
+    _PII_DB.scan(text.encode("ascii"), match_event_handler=on_match)
+    return found
+
+def mask_pii_batch(texts: list[str]) -> list[str]:
+    """
+    Mask PII in a batch of texts, equivalent to [mask_pii(t) for t in texts].
+    When hyperscan is installed, each text is first scanned with a compiled multi-pattern
+    DFA and only texts that may contain PII are passed through the regex substitution.
+    The Hyperscan database is not safe to scan from several threads at once.
+
+    Args:
+        texts (list[str]): The input texts.
+
+    Returns:
+        list[str]: The texts with emails and IPv4 addresses masked.
+    """
+
+    if _PII_DB is None:
+        return [mask_pii(text) for text in texts]
+
+    return [mask_pii(text) if "." in text and _may_contain_pii(text) else text for text in texts]
+
+def _load_lid_model(path: Path):
+    """
+    Load the fastText language-ID model if fasttext and the model file are available.
+
+    Returns:
+        The loaded model, or None to fall back to langdetect.
+    """
+
+    if fasttext is None:
+        logger.info("fasttext is not installed; using langdetect for language detection")
+        return None
+
+    if not path.exists():
+        logger.info("fastText model not found at %s; using langdetect for language detection", path)
+        return None
+
+    try:
+        model = fasttext.load_model(str(path))
+    except ValueError as e:
+        logger.warning("Failed to load fastText model %s, using langdetect: %s", path, e)
+        return None
+
+    logger.info("Using fastText model %s for language detection", path)
+    return model
+
+_LID_MODEL_UNLOADED = object()
+_lid_model = _LID_MODEL_UNLOADED
+
+def _get_lid_model():
+    """
+    Return the fastText model (or None for langdetect), loading it on first use
+    so the backend choice is logged once logging has been configured.
+    """
+
+    global _lid_model
+    if _lid_model is _LID_MODEL_UNLOADED:
+        _lid_model = _load_lid_model(LID_MODEL_PATH)
+    return _lid_model
+
+# LRU of detection results; long texts are keyed by digest to bound memory
+_ENGLISH_CACHE_SIZE = 8192
+_ENGLISH_CACHE_MAX_KEY_LEN = 256
+_english_cache: OrderedDict[str | bytes, bool] = OrderedDict()
 
 def is_english(text: str) -> bool:
     """
-    Detect if the given text is in English.
+    Detect if the given text is in English. Results are cached, so repeated
+    texts are only detected once.
 
     Args:
         text (str): The input text.
@@ -36,13 +176,42 @@ def is_english(text: str) -> bool:
     Returns:
         bool: True if the text is detected as English, False otherwise.
     """
-    
+
+    if len(text) < _ENGLISH_CACHE_MAX_KEY_LEN:
+        key = text
+    else:
+        key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    result = _english_cache.get(key)
+    if result is not None:
+        _english_cache.move_to_end(key)
+        return result
+
+    result = _detect_english(text)
+    _english_cache[key] = result
+    if len(_english_cache) > _ENGLISH_CACHE_SIZE:
+        _english_cache.popitem(last=False)
+
+    return result
+
+def _detect_english(text: str) -> bool:
+    """
+    Run language detection on the text, uncached.
+    """
+
     try:
-        lang = detect(text)
+        lid_model = _get_lid_model()
+        if lid_model is not None:
+            # fastText predicts one line at a time
+            labels, _ = lid_model.predict(text.replace("\n", " "), k=1)
+            lang = labels[0].removeprefix("__label__")
+        else:
+            lang = detect(text)
+
         if lang == "en":
             return True
         else:
-            logger.warning(f"Detected '{lang}' not 'en'.")
+            logger.warning("Detected '%s' not 'en'.", lang)
             return False
     except:
         logger.error("Language detection failed.")
@@ -9,31 +9,95 @@ from pipeline.cleaners import is_english
 
 logger = logging.getLogger(__name__)
 
-def filter_record(text: str, tokenizer, *, min_tokens = 5, max_tokens = 1024) -> bool:
+LOG_TEXT_PREVIEW = 80 # Characters of rejected text included in log messages
+
+MIN_TOKENS = 5
+MAX_TOKENS = 1024
+
+# Upper bound on characters per token for cl100k_base (~P99); longer texts are treated as over max_tokens
+MAX_CHARS_PER_TOKEN = 16
+
+def is_length_out_of_bounds(text: str, *, min_tokens = MIN_TOKENS, max_tokens = MAX_TOKENS) -> bool:
+    '''
+    Decide from text length alone whether the token count falls outside [min_tokens, max_tokens].
+    Byte-level BPE emits at most one token per UTF-8 byte, so the lower bound is exact;
+    the upper bound assumes at most MAX_CHARS_PER_TOKEN characters per token.
+    Args:
+        text (str): The input text.
+        min_tokens (int): Minimum acceptable token count.
+        max_tokens (int): Maximum acceptable token count.
+    Returns:
+        bool: True if the text can be rejected without tokenizing it.
+    '''
+
+    if len(text) < min_tokens and len(text.encode("utf-8", "surrogatepass")) < min_tokens:
+        return True
+
+    return len(text) > max_tokens * MAX_CHARS_PER_TOKEN
+
+def passes_length(text: str, *, min_tokens = MIN_TOKENS, max_tokens = MAX_TOKENS) -> bool:
+    '''
+    Cheap checks that need no tokenization: the text is non-empty and its length can fit the token bounds.
+    Rejections are logged.
+    Args:
+        text (str): The input text.
+        min_tokens (int): Minimum acceptable token count.
+        max_tokens (int): Maximum acceptable token count.
+    Returns:
+        bool: True if the record passes, False if it should be filtered out.
+    '''
+
+    if not text:
+        logger.warning("Record text is empty or does not exist: %r", text)
+        return False
+
+    if is_length_out_of_bounds(text, min_tokens=min_tokens, max_tokens=max_tokens):
+        logger.warning("Record length %d cannot fit token bounds [%d, %d]: %r", len(text), min_tokens, max_tokens, text[:LOG_TEXT_PREVIEW])
+        return False
+
+    return True
+
+def passes_token_and_language(text: str, token_count: int, *, min_tokens = MIN_TOKENS, max_tokens = MAX_TOKENS) -> bool:
+    '''
+    Check the token count against its bounds, then (only if in range) the language.
+    Rejections are logged.
+    Args:
+        text (str): The input text.
+        token_count (int): Token count of the text.
+        min_tokens (int): Minimum acceptable token count.
+        max_tokens (int): Maximum acceptable token count.
+    Returns:
+        bool: True if the record passes, False if it should be filtered out.
+    '''
+
+    if token_count < min_tokens or token_count > max_tokens:
+        logger.warning("Record token count %d out of bounds [%d, %d]: %r", token_count, min_tokens, max_tokens, text[:LOG_TEXT_PREVIEW])
+        return False
+
+    if not is_english(text):
+        logger.warning("Record text is not English: %r", text[:LOG_TEXT_PREVIEW])
+        return False
+
+    return True
+
+def filter_record(text: str, tokenizer, *, min_tokens = MIN_TOKENS, max_tokens = MAX_TOKENS, token_count: int | None = None) -> bool:
     '''
     Filter a record based on text language and token count.
+    Checks run cheapest first: emptiness, length bounds, token count, then language.
     Args:
         text (str): The input text to filter.
         tokenizer: Tokenizer instance for counting tokens.
         min_tokens (int): Minimum acceptable token count.
         max_tokens (int): Maximum acceptable token count.
+        token_count (int | None): Precomputed token count (e.g. from a batched encode); if None, text is encoded with tokenizer.
     Returns:
         bool: True if the record should be filtered out, False to keep it.
     '''
 
-    if not text:
-        logger.warning("Record text is empty or does not exist: %s", text)
-        return True
-
-    if not is_english(text):
-        logger.warning("Record text is not English: %s", text)
+    if not passes_length(text, min_tokens=min_tokens, max_tokens=max_tokens):
         return True
 
-    tokens = tokenizer.encode(text)
-    token_count = len(tokens)
+    if token_count is None:
+        token_count = len(tokenizer.encode(text))
 
-    if token_count < min_tokens or token_count > max_tokens:
-        logger.warning("Record token count %d out of bounds [%d, %d]: %s", token_count, min_tokens, max_tokens, text)
-        return True
-    
-    return False
+    return not passes_token_and_language(text, token_count, min_tokens=min_tokens, max_tokens=max_tokens)
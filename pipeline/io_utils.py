@@ -5,18 +5,38 @@ Functions for downloading data and reading/writing files.
 """
 
 from pathlib import Path
-import hashlib
+import codecs
+import io
 import requests
+import urllib3
 import logging
 import tempfile
 from typing import Iterator
-from typing import Iterator, Callable, Any, Literal
+from typing import Iterator, Callable, Any, Literal, IO
 import json
-import gzip
+import orjson
+from blake3 import blake3
+
+try:
+    from isal import igzip as gzip  # ISA-L accelerated drop-in for stdlib gzip
+except ImportError:
+    import gzip
 
 logger = logging.getLogger(__name__)
 
-def download_dataset(url: str, dest: str | Path, timeout: int = 20) -> Path:  # Added type hint for url
+DOWNLOAD_CHUNK_SIZE = 1 << 20 # 1 MiB blocks when copying downloads to disk
+READ_BUFFER_SIZE = 1 << 20 # 1 MiB read-ahead for JSONL input
+
+def _copy_and_hash(src, dst, hasher, length: int = DOWNLOAD_CHUNK_SIZE) -> None:
+    """
+    Copy a file-like object to another in blocks, feeding each block to a hasher.
+    """
+
+    while chunk := src.read(length):
+        dst.write(chunk)
+        hasher.update(chunk)
+
+def download_dataset(url: str, dest: str | Path, timeout: int = 20, expected_blake3: str | None = None, session: requests.Session | None = None) -> Path:  # Added type hint for url
     """
     Download a dataset from a given URL to the specified destination path.
 
@@ -24,13 +44,16 @@ def download_dataset(url: str, dest: str | Path, timeout: int = 20) -> Path:  #
         url (str): The URL of the dataset to download.
         dest (Path): The destination path where the dataset will be saved.
         timeout (int): Request timeout in seconds (default: 20).
+        expected_blake3 (str | None): Expected BLAKE3 hex digest of the file; verified if given.
+        session (requests.Session | None): Session to reuse connections across downloads (default: none).
 
     Returns:
         Path: The path to the downloaded dataset.
         
     Raises:
         requests.RequestException: If download fails due to network issues.
-        IOError: If file validation fails.
+        urllib3.exceptions.HTTPError: If the connection fails while streaming the body.
+        IOError: If file validation (size or digest) fails.
     """
     
     dest = Path(dest)
@@ -44,34 +67,63 @@ def download_dataset(url: str, dest: str | Path, timeout: int = 20) -> Path:  #
     temp_path = None  # Initialize to avoid UnboundLocalError
 
     try:
-        with requests.get(url, stream=True, timeout=timeout) as r:
+        with (session or requests).get(url, stream=True, timeout=timeout) as r:
             r.raise_for_status()
 
             total = int(r.headers.get('content-length', 0))
 
             # Use a temporary file to avoid incomplete downloads
             with tempfile.NamedTemporaryFile("wb", delete=False, dir=dest.parent) as tmp:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:  # Filter out keep-alive chunks
-                        tmp.write(chunk)
-                
                 temp_path = Path(tmp.name)
+
+                # Copy the raw stream in large blocks, hashing as we go; decode_content undoes any gzip/deflate transfer encoding
+                r.raw.decode_content = True
+                hasher = blake3()
+                _copy_and_hash(r.raw, tmp, hasher)
         
         # Validate file size if content-length was provided
         if total and temp_path.stat().st_size < 0.9 * total:
             raise IOError(f"Downloaded file size ({temp_path.stat().st_size}) is much smaller than expected ({total})")
+
+        digest = hasher.hexdigest()
+        if expected_blake3 and digest != expected_blake3.lower():
+            raise IOError(f"Downloaded file BLAKE3 digest ({digest}) does not match expected ({expected_blake3})")
         
         temp_path.replace(dest)  # atomic rename
 
-        logger.info(f"Successfully downloaded {url.split('/')[-1]} to {dest}")
+        logger.info(f"Successfully downloaded {url.split('/')[-1]} to {dest} (blake3 {digest})")
         return dest
     
-    except (requests.RequestException, IOError) as e:
+    # Reading r.raw directly surfaces urllib3 errors that iter_content would have wrapped
+    except (requests.RequestException, urllib3.exceptions.HTTPError, IOError) as e:
         logger.warning(f"Failed to download {url}. Error: {e}")
         if temp_path and temp_path.exists():
             temp_path.unlink()  # Clean up temp file
         raise
 
+def _loads_fallback(raw: str):
+    """
+    Parse a JSON line with orjson, falling back to the stdlib json module for input
+    orjson rejects but json accepts (lone surrogate escapes, NaN/Infinity).
+    """
+
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return json.loads(raw)
+
+def _universal_lines(f: IO[bytes]) -> Iterator[bytes]:
+    """
+    Iterate a binary file by line, also breaking on bare \r as text mode does.
+    """
+
+    for raw in f:
+        if b"\r" in raw:
+            # Binary iteration only splits on \n; bytes.splitlines keeps \r\n together
+            yield from raw.splitlines(keepends=True)
+        else:
+            yield raw
+
 def stream_jsonl(
         path: str | Path,
         *,
@@ -99,8 +151,16 @@ def stream_jsonl(
       dict objects parsed from each valid JSON line.
 
     Notes:
-      - Empty/whitespace-only lines are skipped.
-      - Uses text mode streaming (no full-file loads).
+      - Empty/whitespace-only lines are skipped, including lines holding only
+        non-ASCII whitespace such as U+00A0.
+      - UTF-8 input is streamed as bytes through a 1 MiB read buffer and parsed
+        without decoding; a line is only decoded (honouring decode_errors and
+        on_bad_decode) if it fails to parse. Other encodings use text mode.
+        Both paths accept \n, \r\n and bare \r line endings.
+      - Lines orjson rejects are retried with the stdlib json module, so lone
+        surrogate escapes and NaN/Infinity still parse.
+      - Integers wider than 64 bits are parsed by orjson as floats (losing
+        precision) rather than as Python ints.
       - Line numbers are included in log messages for quick triage.
     """
 
@@ -109,52 +169,80 @@ def stream_jsonl(
     # Choose opener based on file extension
     opener = gzip.open if (p.suffix == ".gz") else open
 
-    # Use text mode ('rt') so json.loads gets str, not bytes
-    with opener(p, mode="rt", encoding=encoding, errors=decode_errors) as f:
+    if codecs.lookup(encoding).name == "utf-8":
+        # orjson parses UTF-8 bytes directly, so skip per-line decoding
+        if opener is open:
+            f = open(p, mode="rb", buffering=READ_BUFFER_SIZE)
+        else:
+            f = io.BufferedReader(opener(p, mode="rb"), buffer_size=READ_BUFFER_SIZE)
+        lines = _universal_lines(f)
+        bom = b"\xef\xbb\xbf"
+    else:
+        f = opener(p, mode="rt", encoding=encoding, errors=decode_errors)
+        lines = f
+        bom = "\ufeff"
+
+    with f:
         saw_content = False
 
-        for line_num, raw in enumerate(f, start=1):
-            if not raw.strip():
+        for line_num, raw in enumerate(lines, start=1):
+            stripped = raw.strip()
+            if not stripped:
                 continue  # skip empty/whitespace-only lines
 
+            # bytes.strip only knows ASCII whitespace; a non-ASCII lead byte may be e.g. U+00A0
+            if isinstance(raw, bytes) and stripped[0] >= 0x80:
+                if not raw.decode(encoding, decode_errors).strip():
+                    continue
+
             # Optionally strip BOM on first non-empty line
             if strip_bom and not saw_content:
-                if raw.startswith("\ufeff"):
-                    raw = raw.lstrip("\ufeff")
+                if raw.startswith(bom):
+                    raw = raw[len(bom):]
             
             saw_content = True
 
-            if on_bad_decode != "skip" and "\ufffd" in raw:
-                msg = f"{p}:{line_num} - Decode error (replacement char found)"
-                if on_bad_decode == "raise":
-                    raise UnicodeDecodeError(encoding, b"", 0, 0, msg)
-                elif on_bad_decode == "log":
-                    logger.warning(msg)
-            
-            try:
-                rec = json.loads(raw)
-            
-            except json.JSONDecodeError as e:
-                if on_bad_json == "raise":
-                    raise
-                elif on_bad_json == "log":
-                    logger.warning(f"{p}:{line_num} - Bad JSON at: {e}")
-                continue
+            if isinstance(raw, bytes):
+                try:
+                    rec = orjson.loads(raw)
+                except orjson.JSONDecodeError:
+                    # Slow path: decode as text mode would, so decode_errors/on_bad_decode apply
+                    raw = raw.decode(encoding, decode_errors)
+
+            if isinstance(raw, str):
+                if on_bad_decode != "skip" and "\ufffd" in raw:
+                    if on_bad_decode == "raise":
+                        raise UnicodeDecodeError(encoding, b"", 0, 0, f"{p}:{line_num} - Decode error (replacement char found)")
+                    elif on_bad_decode == "log":
+                        logger.warning("%s:%d - Decode error (replacement char found)", p, line_num)
+                
+                try:
+                    rec = _loads_fallback(raw)
+                
+                except json.JSONDecodeError as e:
+                    if on_bad_json == "raise":
+                        raise
+                    elif on_bad_json == "log":
+                        logger.warning("%s:%d - Bad JSON at: %s", p, line_num, e)
+                    continue
             
             if validator is not None:
                 try:
                     ok = bool(validator(rec))
                 
                 except Exception as e:
-                    logger.warning(f"{p}:{line_num} - Validator raised exception: {e}")
+                    logger.warning("%s:%d - Validator raised exception: %s", p, line_num, e)
                     ok = False
                 
                 if not ok:
-                    logger.warning(f"{p}:{line_num} - Record failed validation: {rec}")
+                    # Log only the keys; records can be kilobytes
+                    if logger.isEnabledFor(logging.WARNING):
+                        keys = list(rec)[:10] if isinstance(rec, dict) else type(rec).__name__
+                        logger.warning("%s:%d - Record failed validation (keys: %s)", p, line_num, keys)
                     continue
 
             if not isinstance(rec, dict):
-                logger.warning(f"{p}:{line_num} - Expected JSON object (dict), got {type(rec)}")
+                logger.warning("%s:%d - Expected JSON object (dict), got %s", p, line_num, type(rec))
                 continue
 
             yield rec
\ No newline at end of file
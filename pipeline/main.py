@@ -5,30 +5,179 @@ Entry point for running the complete data pipeline.
 """
 
 import logging
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from collections import OrderedDict
+from itertools import islice
 from pathlib import Path
 from pipeline.io_utils import stream_jsonl, download_dataset
-from pipeline.filters import filter_record
-from pipeline.cleaners import mask_pii
+from pipeline.filters import passes_length, passes_token_and_language
+from pipeline.cleaners import mask_pii_batch
+import requests
 import tiktoken
-import gzip
+from blake3 import blake3
 import json
+import orjson
 import tempfile
 from tqdm import tqdm
 from pipeline.loaders import load_dolly15k
 
+try:
+    from isal import igzip as gzip  # ISA-L accelerated drop-in for stdlib gzip
+except ImportError:
+    import gzip
+
+OUTPUT_COMPRESSLEVEL = 1 # Favour speed; processed output is transient, not archival
+BATCH_SIZE = 1024 # Records tokenized per encode_batch call
+QUEUE_DEPTH = 4 # Batches buffered between pipeline stages
+WRITE_BUFFER_SIZE = 1 << 20 # Bytes of serialized records accumulated per output write
+TOKEN_CACHE_SIZE = 100_000 # Token counts remembered per file, keyed by text digest
+DOWNLOAD_WORKERS = 8 # Concurrent dataset downloads
+
+_DONE = object() # Sentinel marking the end of a stage's output
+
+def _batched(iterable, size: int):
+    '''
+    Yield successive lists of up to `size` items from an iterable.
+    '''
+    it = iter(iterable)
+    while batch := list(islice(it, size)):
+        yield batch
+
+def _queue_put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    '''
+    Put an item on a bounded queue, giving up if another stage has failed.
+    Returns:
+        bool: True if the item was queued, False if the pipeline was stopped.
+    '''
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _queue_get(q: queue.Queue, stop: threading.Event):
+    '''
+    Get an item from a queue, returning _DONE if another stage has failed.
+    '''
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+def _count_tokens(texts: list[str], tokenizer, cache: OrderedDict[bytes, int], num_threads: int = 1) -> list[int]:
+    '''
+    Count tokens for a batch of texts, reusing counts for texts seen earlier in the file.
+    Only unseen texts are encoded, each once, in a single encode_batch call.
+    Args:
+        texts (list[str]): The texts to count.
+        tokenizer: Tokenizer instance providing encode_batch.
+        cache (OrderedDict[bytes, int]): Token counts keyed by 16-byte BLAKE3 digest of the text; updated in place.
+        num_threads (int): Threads tiktoken may use for encode_batch.
+    Returns:
+        list[int]: Token count for each text.
+    '''
+    keys = [blake3(text.encode("utf-8", "surrogatepass")).digest(length=16) for text in texts]
+
+    misses = {}
+    for key, text in zip(keys, texts):
+        if key in cache:
+            cache.move_to_end(key)
+        elif key not in misses:
+            misses[key] = text
+
+    if misses:
+        # tiktoken releases the GIL and fans out across threads
+        encoded = tokenizer.encode_batch(list(misses.values()), num_threads=num_threads)
+        for key, tokens in zip(misses, encoded):
+            cache[key] = len(tokens)
+
+    counts = [cache[key] for key in keys]
+
+    # Evict least recently used entries only after the batch is resolved
+    while len(cache) > TOKEN_CACHE_SIZE:
+        cache.popitem(last=False)
+
+    return counts
+
+def _read_stage(input_path: Path, loader: callable, out_q: queue.Queue, stop: threading.Event) -> int:
+    '''
+    Pipeline stage: stream records, extract their text, drop empty or out-of-length texts,
+    and queue the rest in batches with PII masked. Rejected records never pay the PII scan.
+    Returns:
+        int: Number of records rejected at this stage.
+    '''
+    num_skipped = 0
+    try:
+        for batch in _batched(stream_jsonl(input_path), BATCH_SIZE):
+            texts = []
+            for record in batch:
+                text = loader(record) # Extract/load
+                if not passes_length(text):
+                    num_skipped += 1
+                    continue
+                texts.append(text)
+
+            texts = mask_pii_batch(texts) # Clean
+            if not _queue_put(out_q, texts, stop):
+                break
+        return num_skipped
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        _queue_put(out_q, _DONE, stop)
+
+def _write_stage(out_f, in_q: queue.Queue, stop: threading.Event) -> None:
+    '''
+    Pipeline stage: write batches of kept texts to the output file.
+    Records are serialized into a buffer that is flushed once it reaches WRITE_BUFFER_SIZE,
+    so the compressor sees few large writes rather than one per record, and the buffer
+    never holds more than WRITE_BUFFER_SIZE plus one record.
+    '''
+    buf = bytearray()
+    try:
+        while (texts := _queue_get(in_q, stop)) is not _DONE:
+            for text in texts:
+                try:
+                    buf += orjson.dumps({"text": text})
+                except orjson.JSONEncodeError:
+                    # orjson rejects lone surrogates; the stdlib escapes them as \uXXXX
+                    buf += json.dumps({"text": text}).encode("ascii")
+                buf += b"\n"
+
+                if len(buf) >= WRITE_BUFFER_SIZE:
+                    out_f.write(buf)
+                    buf.clear()
+
+        if buf and not stop.is_set():
+            out_f.write(buf)
+    except BaseException:
+        stop.set()
+        raise
+
 def process_file(
         input_path: str | Path, 
         output_path: str | Path, 
         loader: callable = load_dolly15k,
         *, 
-        tokenizer = tiktoken.get_encoding("cl100k_base")
+        tokenizer = None,
+        num_threads: int | None = None
         ) -> bool:
     '''
     Process a single input file: filter records and mask PII, writing to output.
     Args:
         input_path (str | Path): Path to the input .jsonl or .jsonl.gz file.
         output_path (str | Path): Path to the output .jsonl.gz file.
-        tokenizer: Tokenizer instance for filtering records based on token count.
+        tokenizer: Tokenizer instance for filtering records based on token count
+            (default: cl100k_base, created on first use in each process).
+        num_threads (int | None): Threads tiktoken may use for batched encoding (default: os.cpu_count()).
     
     Returns:
         bool: True if processing succeeded, False otherwise.
@@ -36,6 +185,12 @@ def process_file(
     num_kept = 0
     num_skipped = 0
 
+    if tokenizer is None:
+        tokenizer = tiktoken.get_encoding("cl100k_base")
+
+    if num_threads is None:
+        num_threads = os.cpu_count() or 1
+
     input_path = Path(input_path)
     output_path = Path(output_path)
 
@@ -55,16 +210,41 @@ def process_file(
         temp_output_path = Path(temp_file.name)
 
     try:
-        with gzip.open(temp_output_path, "wt", encoding="utf-8") as out_f:
-            for idx, record in enumerate(stream_jsonl(input_path), start=1):
-                text = loader(record) # Extract/load
-                text = mask_pii(text) # Clean
-                
-                if filter_record(text, tokenizer):
-                    num_skipped += 1
-                else:
-                    out_f.write(json.dumps({"text": text}) + "\n")
-                    num_kept += 1
+        # Reading, tokenizing and writing run in separate threads. Only gzip (de)compression and
+        # tiktoken's encode_batch release the GIL; PII regexes, orjson and language detection
+        # hold it, so the stages overlap only around those calls.
+        text_q = queue.Queue(maxsize=QUEUE_DEPTH)
+        kept_q = queue.Queue(maxsize=QUEUE_DEPTH)
+        stop = threading.Event()
+        token_count_cache: OrderedDict[bytes, int] = OrderedDict()
+
+        with gzip.open(temp_output_path, "wb", compresslevel=OUTPUT_COMPRESSLEVEL) as out_f, ThreadPoolExecutor(max_workers=2) as executor:
+            reader = executor.submit(_read_stage, input_path, loader, text_q, stop)
+            writer = executor.submit(_write_stage, out_f, kept_q, stop)
+
+            try:
+                while (texts := _queue_get(text_q, stop)) is not _DONE:
+                    token_counts = _count_tokens(texts, tokenizer, token_count_cache, num_threads)
+
+                    # The reader already applied passes_length; language is checked last
+                    kept = [
+                        text for text, token_count in zip(texts, token_counts)
+                        if passes_token_and_language(text, token_count)
+                    ]
+                    num_kept += len(kept)
+                    num_skipped += len(texts) - len(kept)
+
+                    if not _queue_put(kept_q, kept, stop):
+                        break
+            except BaseException:
+                stop.set()
+                raise
+            finally:
+                _queue_put(kept_q, _DONE, stop)
+
+            # Re-raise any error from the reader or writer thread
+            num_skipped += reader.result()
+            writer.result()
 
         # Atomic rename
         temp_output_path.rename(output_path)
@@ -82,8 +262,18 @@ def process_file(
 
 def process_all(
         input_dir: str | Path = "data/raw", 
-        output_dir: str | Path = "data/processed"
+        output_dir: str | Path = "data/processed",
+        *,
+        max_workers: int | None = None
         ) -> None:
+    '''
+    Process every .jsonl/.jsonl.gz file in input_dir in parallel, one worker process per file.
+    Args:
+        input_dir (str | Path): Directory containing the raw input files.
+        output_dir (str | Path): Directory for the processed .jsonl.gz files.
+        max_workers (int | None): Maximum number of worker processes (default: os.cpu_count()),
+            capped at the number of input files.
+    '''
 
     input_dir = Path(input_dir)
     output_dir = Path(output_dir)
@@ -96,28 +286,73 @@ def process_all(
     
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    for input_file in tqdm(list(input_dir.glob("*.jsonl*")), desc="Processing files"):
-        output_file = output_dir / (input_file.stem + ".jsonl.gz")
-        if process_file(input_file, output_file):
-            successful += 1
-        total += 1
+    input_files = list(input_dir.glob("*.jsonl*"))
+
+    # Files are independent, so each is processed in its own worker process. The CPUs are
+    # split between workers so their tokenizer thread pools don't oversubscribe the machine.
+    # There is no point starting more workers than files, so a single file gets every CPU.
+    num_cpus = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers or num_cpus, len(input_files)))
+    num_threads = max(1, num_cpus // max_workers)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(process_file, input_file, output_dir / (input_file.stem + ".jsonl.gz"), num_threads=num_threads): input_file
+            for input_file in input_files
+        }
+
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Processing files"):
+            try:
+                if future.result():
+                    successful += 1
+            except Exception as e:
+                logging.error(f"Error processing file {futures[future]}: {e}")
+            total += 1
 
     logging.info(f"Processing complete. Successful: {successful}, Total: {total}")
 
-def download_all():
+def _download_entry(dataset: dict, session: requests.Session) -> None:
+    '''
+    Download one manifest entry into data/raw, logging instead of raising on failure.
+    '''
+    url = dataset.get("url", "No URL found")
+    dest = dataset.get("filename", "unknown_file")
+    dest = Path("data/raw") / dest
+    
+    try:
+        download_dataset(url, dest, expected_blake3=dataset.get("blake3"), session=session)
+    except:
+        logging.warning(f"Failed to download dataset from {url}")
+
+def download_all(max_workers: int = DOWNLOAD_WORKERS):
     manifest_path = Path("manifests/datasets.json")
     with open(manifest_path, "r", encoding="utf-8") as f:
         manifest = json.load(f)
 
-    for dataset in tqdm(manifest.get("datasets", [])):
-        url = dataset.get("url", "No URL found")
-        dest = dataset.get("filename", "unknown_file")
-        dest = Path("data/raw") / dest
-        
-        try:
-            download_dataset(url, dest)
-        except:
-            logging.warning(f"Failed to download dataset from {url}")
+    datasets = manifest.get("datasets", [])
+
+    # Sessions are not thread-safe, so each download thread gets its own to reuse connections;
+    # all of them are closed once the downloads finish
+    local = threading.local()
+    sessions: list[requests.Session] = []
+
+    def get_session() -> requests.Session:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+            sessions.append(local.session)
+        return local.session
+
+    try:
+        # Downloads are network-bound, so overlap them in threads
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(tqdm(
+                executor.map(lambda dataset: _download_entry(dataset, get_session()), datasets),
+                total=len(datasets),
+                desc="Downloading datasets",
+            ))
+    finally:
+        for session in sessions:
+            session.close()
 
 def main():
     logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -1,17 +1,92 @@
 import pytest
+from collections import OrderedDict
 
-from pipeline.cleaners import mask_pii, is_english
+import pipeline.cleaners
+from pipeline.cleaners import mask_pii, mask_pii_batch, is_english
 
 def test_email():
     text = "Contact me at email@example.com"
     cleaned = mask_pii(text)
     assert cleaned == "Contact me at |||EMAIL|||"
 
+def test_email_with_tag_and_subdomain():
+    text = "Mail first.last+tag@mail.example.co.uk today."
+    cleaned = mask_pii(text)
+    assert cleaned == "Mail |||EMAIL||| today."
+
 def test_ip_address():
     text = "My IP is 192.168.1.1"
     cleaned = mask_pii(text)
     assert cleaned == "My IP is |||IP|||"
 
+def test_email_and_ip():
+    text = "Mail admin@example.com from 10.0.0.1"
+    cleaned = mask_pii(text)
+    assert cleaned == "Mail |||EMAIL||| from |||IP|||"
+
+def test_no_pii_unchanged():
+    text = "Nothing to mask here"
+    assert mask_pii(text) == text
+
+def test_mask_pii_batch_matches_mask_pii():
+    texts = ["Contact me at email@example.com", "My IP is 192.168.1.1", "No PII.", "", "Café at 10.0.0.1"]
+    assert mask_pii_batch(texts) == [mask_pii(text) for text in texts]
+
+def test_hyperscan_prefilter_matches_re():
+    pytest.importorskip("hyperscan")
+    assert pipeline.cleaners._PII_DB is not None
+
+    texts = [
+        # Negatives
+        "v1.2.3", "a.b", "1.2.3", "a@b.c", "@example.com", "user@", "v1.2.3.4", "1.2.3.4x",
+        "a@b.com_x", "1.2.3.4_5", "no pii here.",
+        # Positives, including word-boundary edge cases
+        "x@y.co", "mail first.last+tag@mail.example.co.uk now", "1.2.3.4", "(10.0.0.1)",
+        "ip=192.168.1.1.", "foo_a@b.com", "-a@b.com-", "999.999.999.999", "1.2.3.4.5",
+    ]
+    for text in texts:
+        assert pipeline.cleaners._may_contain_pii(text) == bool(pipeline.cleaners._PII_RE.search(text)), text
+    assert mask_pii_batch(texts) == [mask_pii(text) for text in texts]
+
 def test_is_english():
     assert is_english("I like to code a lot.")
-    assert not is_english("Eu gosto muito de programar.")
\ No newline at end of file
+    assert not is_english("Eu gosto muito de programar.")
+
+@pytest.fixture
+def detect_calls(monkeypatch):
+    calls = []
+
+    def fake_detect(text):
+        calls.append(text)
+        return True
+
+    monkeypatch.setattr(pipeline.cleaners, "_detect_english", fake_detect)
+    monkeypatch.setattr(pipeline.cleaners, "_english_cache", OrderedDict())
+    return calls
+
+def test_is_english_cached_short_text(detect_calls):
+    text = "I like to code a lot."
+    assert is_english(text)
+    assert is_english(text)
+    assert detect_calls == [text]
+
+def test_is_english_cached_long_text(detect_calls):
+    # Texts of 256+ characters are keyed by digest
+    text = "I like to code a lot. " * 50
+    assert is_english(text)
+    assert is_english(text)
+    assert detect_calls == [text]
+
+def test_is_english_cache_evicts_least_recently_used(detect_calls, monkeypatch):
+    monkeypatch.setattr(pipeline.cleaners, "_ENGLISH_CACHE_SIZE", 2)
+
+    is_english("first text")
+    is_english("second text")
+    is_english("first text")  # refreshes "first text"
+    is_english("third text")  # evicts "second text"
+    assert len(pipeline.cleaners._english_cache) == 2
+
+    detect_calls.clear()
+    is_english("first text")
+    is_english("second text")
+    assert detect_calls == ["second text"]
@@ -1,17 +1,42 @@
 import pytest
-from pipeline.filters import filter_record
+from pipeline.filters import filter_record, is_length_out_of_bounds, passes_length, passes_token_and_language, MAX_CHARS_PER_TOKEN
 from tiktoken import get_encoding
 
 tokenizer = get_encoding("cl100k_base")
 
 def test_empty():
     rec = {"text": ""}
-    assert filter_record(rec, tokenizer)
+    assert filter_record(rec["text"], tokenizer)
 
 def test_non_english():
     rec = {"text": "Oi, bom dia. Tudo bem?"}
-    assert filter_record(rec, tokenizer)
+    assert filter_record(rec["text"], tokenizer)
 
 def test_too_few_tokens():
     rec = {"text": "Hi"}
-    assert filter_record(rec, tokenizer)
\ No newline at end of file
+    assert filter_record(rec["text"], tokenizer)
+
+def test_precomputed_token_count():
+    text = "I like to code a lot, especially in Python."
+    assert not filter_record(text, tokenizer)
+    assert filter_record(text, tokenizer, token_count=2000)
+
+
+def test_length_out_of_bounds():
+    assert is_length_out_of_bounds("Hi")
+    assert is_length_out_of_bounds("a" * (1024 * MAX_CHARS_PER_TOKEN + 1))
+    assert not is_length_out_of_bounds("I like to code a lot.")
+    # Multi-byte characters can each produce several tokens
+    assert not is_length_out_of_bounds("日本語")
+
+
+def test_passes_length():
+    assert not passes_length("")
+    assert not passes_length("Hi")
+    assert passes_length("I like to code a lot.")
+
+def test_passes_token_and_language():
+    text = "I like to code a lot, especially in Python."
+    assert passes_token_and_language(text, 10)
+    assert not passes_token_and_language(text, 2)
+    assert not passes_token_and_language("Eu gosto muito de programar em Python.", 10)
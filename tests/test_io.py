@@ -4,10 +4,13 @@ IO Tests
 Unit tests for the IO components.
 """
 
+import io
+import math
 import pytest
 import json
 import gzip
 from pathlib import Path
+from blake3 import blake3
 from pipeline.io_utils import download_dataset, stream_jsonl
 
 # download_dataset
@@ -21,6 +24,47 @@ def test_download_dataset_basic(tmp_path: Path):
     assert path.exists()
     assert path.stat().st_size > 0
 
+class FakeResponse:
+    def __init__(self, body: bytes):
+        self.raw = io.BytesIO(body)
+        self.headers = {"content-length": str(len(body))}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+class FakeSession:
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def get(self, url, **kwargs):
+        return FakeResponse(self.body)
+
+BODY = b'{"a": 1}\n{"b": 2}\n'
+
+def test_download_dataset_blake3_match(tmp_path: Path):
+    dest = tmp_path / "data.jsonl"
+
+    path = download_dataset("https://example.com/data.jsonl", dest, expected_blake3=blake3(BODY).hexdigest(), session=FakeSession(BODY))
+
+    assert path == dest
+    assert dest.read_bytes() == BODY
+    assert list(tmp_path.iterdir()) == [dest]
+
+def test_download_dataset_blake3_mismatch(tmp_path: Path):
+    dest = tmp_path / "data.jsonl"
+
+    with pytest.raises(IOError, match="BLAKE3"):
+        download_dataset("https://example.com/data.jsonl", dest, expected_blake3="0" * 64, session=FakeSession(BODY))
+
+    assert not dest.exists()
+    assert list(tmp_path.iterdir()) == []
+
 def write_jsonl(p: Path, rows):
     p.write_text("".join([json.dumps(r) + "\n" for r in rows]), encoding="utf-8")
 
@@ -47,4 +91,44 @@ def test_stream_skip_empty_line(tmp_path: Path):
     p.write_text('{"a": 1}\n\n{"b": 2}\n', encoding="utf-8")
 
     results = list(stream_jsonl(p))
-    assert results == [{"a": 1}, {"b": 2}]
\ No newline at end of file
+    assert results == [{"a": 1}, {"b": 2}]
+
+def test_stream_strip_bom(tmp_path: Path):
+    p = tmp_path / "data.jsonl"
+    p.write_bytes(b'\xef\xbb\xbf{"a": 1}\n{"b": 2}\n')
+
+    results = list(stream_jsonl(p))
+    assert results == [{"a": 1}, {"b": 2}]
+
+def test_stream_invalid_utf8_replaced(tmp_path: Path):
+    p = tmp_path / "data.jsonl"
+    p.write_bytes(b'{"a": "\xff"}\n{"b": 2}\n')
+
+    results = list(stream_jsonl(p))
+    assert results == [{"a": "\ufffd"}, {"b": 2}]
+
+def test_stream_falls_back_to_stdlib_json(tmp_path: Path):
+    p = tmp_path / "data.jsonl"
+    # orjson rejects lone surrogates and NaN/Infinity; the stdlib accepts them
+    p.write_text('{"a": "\\ud800"}\n{"b": NaN}\n{"c": Infinity}\n', encoding="utf-8")
+
+    results = list(stream_jsonl(p))
+    assert results[0] == {"a": "\ud800"}
+    assert math.isnan(results[1]["b"])
+    assert results[2] == {"c": math.inf}
+
+def test_stream_cr_line_endings(tmp_path: Path):
+    p = tmp_path / "data.jsonl"
+    p.write_bytes(b'{"a": 1}\r{"b": 2}\r{"c": 3}\r\n')
+
+    results = list(stream_jsonl(p))
+    assert results == [{"a": 1}, {"b": 2}, {"c": 3}]
+
+def test_stream_skip_non_ascii_whitespace_line(tmp_path: Path, caplog):
+    p = tmp_path / "data.jsonl"
+    p.write_text('{"a": 1}\n\u00a0\u3000\n{"b": 2}\n', encoding="utf-8")
+
+    with caplog.at_level("WARNING"):
+        results = list(stream_jsonl(p))
+    assert results == [{"a": 1}, {"b": 2}]
+    assert "Bad JSON" not in caplog.text
@@ -0,0 +1,310 @@
+"""
+Pipeline Tests
+
+Tests for processing a single file end to end.
+"""
+
+import gzip
+import json
+import logging
+import queue
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+import pipeline.filters
+import pipeline.main
+from pipeline.cleaners import mask_pii
+from pipeline.filters import filter_record
+from pipeline.loaders import load_dolly15k
+from pipeline.main import process_all, process_file, _count_tokens
+
+class FakeTokenizer:
+    """Whitespace tokenizer standing in for tiktoken."""
+
+    def encode(self, text):
+        return text.split()
+
+    def encode_batch(self, texts, num_threads=1):
+        return [text.split() for text in texts]
+
+class CountingTokenizer(FakeTokenizer):
+    def __init__(self):
+        self.encoded = []
+
+    def encode_batch(self, texts, num_threads=1):
+        self.encoded.extend(texts)
+        return super().encode_batch(texts, num_threads)
+
+class FailingTokenizer(FakeTokenizer):
+    def encode_batch(self, texts, num_threads=1):
+        raise RuntimeError("tokenizer failed")
+
+ROWS = [
+    {"prompt": "Please email the team at team@example.com today", "context": "", "response": "Sure, I will send it now."},
+    {"prompt": "Which server is at 10.0.0.1 in the lab?", "context": "", "response": "That is the build server."},
+    {"prompt": "", "context": "", "response": ""},
+    {"prompt": "Hi", "context": "", "response": ""},
+    {"prompt": "Olá, tudo bem com você hoje?", "context": "", "response": "Tudo ótimo, obrigado."},
+    {"prompt": "word " * 1100, "context": "", "response": ""},
+    {"prompt": "Please email the team at team@example.com today", "context": "", "response": "Sure, I will send it now."},
+] * 5
+
+@pytest.fixture(autouse=True)
+def pipeline_settings(monkeypatch):
+    # Deterministic stand-in for langdetect
+    monkeypatch.setattr(pipeline.filters, "is_english", lambda text: "Olá" not in text)
+    # Small batches and queues so records cross several batches and the stages block on each other
+    monkeypatch.setattr(pipeline.main, "BATCH_SIZE", 2)
+    monkeypatch.setattr(pipeline.main, "QUEUE_DEPTH", 1)
+
+def write_jsonl(p: Path, rows):
+    p.write_text("".join([json.dumps(r) + "\n" for r in rows]), encoding="utf-8")
+
+def run_with_timeout(fn, timeout: float = 10):
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        return executor.submit(fn).result(timeout=timeout)
+    finally:
+        executor.shutdown(wait=False)
+
+def serial_reference(rows, tokenizer):
+    kept = []
+    num_skipped = 0
+    for record in rows:
+        text = mask_pii(load_dolly15k(record))
+        if filter_record(text, tokenizer):
+            num_skipped += 1
+        else:
+            kept.append(text)
+    return kept, num_skipped
+
+def test_process_file_matches_serial(tmp_path: Path, caplog):
+    in_path = tmp_path / "in.jsonl"
+    out_path = tmp_path / "out" / "out.jsonl.gz"
+    out_path.parent.mkdir()
+    write_jsonl(in_path, ROWS)
+
+    with caplog.at_level(logging.INFO):
+        assert run_with_timeout(lambda: process_file(in_path, out_path, tokenizer=FakeTokenizer()))
+
+    expected_kept, expected_skipped = serial_reference(ROWS, FakeTokenizer())
+    with gzip.open(out_path, "rt", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert lines == [json.dumps({"text": text}, ensure_ascii=False, separators=(",", ":")) for text in expected_kept]
+    assert lines[0] == '{"text":"Please email the team at |||EMAIL||| today\\n\\nSure, I will send it now."}'
+
+    counts = re.search(r"Kept: (\d+), Skipped: (\d+)", caplog.text)
+    assert counts is not None
+    assert (int(counts.group(1)), int(counts.group(2))) == (len(expected_kept), expected_skipped)
+
+    assert list(out_path.parent.iterdir()) == [out_path]
+
+def bad_loader(record):
+    if record.get("prompt") == "Hi":
+        raise RuntimeError("loader failed")
+    return load_dolly15k(record)
+
+@pytest.mark.parametrize("loader, tokenizer", [
+    (bad_loader, FakeTokenizer()),
+    (load_dolly15k, FailingTokenizer()),
+], ids=["loader", "tokenizer"])
+def test_process_file_stage_failure(tmp_path: Path, loader, tokenizer):
+    in_path = tmp_path / "in.jsonl"
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    write_jsonl(in_path, ROWS)
+
+    assert run_with_timeout(lambda: process_file(in_path, out_dir / "out.jsonl.gz", loader, tokenizer=tokenizer)) is False
+    assert list(out_dir.iterdir()) == []
+
+class FailingOutput:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def write(self, data):
+        raise OSError("disk full")
+
+def test_process_file_writer_failure(tmp_path: Path, monkeypatch):
+    in_path = tmp_path / "in.jsonl"
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    write_jsonl(in_path, ROWS)
+    monkeypatch.setattr(pipeline.main.gzip, "open", lambda *args, **kwargs: FailingOutput())
+
+    assert run_with_timeout(lambda: process_file(in_path, out_dir / "out.jsonl.gz", tokenizer=FakeTokenizer())) is False
+    assert list(out_dir.iterdir()) == []
+
+def test_process_file_keeps_lone_surrogate_record(tmp_path: Path, caplog):
+    in_path = tmp_path / "in.jsonl"
+    out_path = tmp_path / "out.jsonl.gz"
+    # json.dumps escapes the lone surrogate, which orjson cannot serialize
+    rows = [
+        {"prompt": "Scraped text with a stray \ud800 surrogate in it", "context": "", "response": ""},
+        {"prompt": "A perfectly clean record about programming", "context": "", "response": ""},
+    ]
+    write_jsonl(in_path, rows)
+
+    with caplog.at_level(logging.INFO):
+        assert run_with_timeout(lambda: process_file(in_path, out_path, tokenizer=FakeTokenizer()))
+
+    with gzip.open(out_path, "rt", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert records == [{"text": load_dolly15k(row)} for row in rows]
+    assert "Kept: 2, Skipped: 0" in caplog.text
+
+def test_count_tokens_encodes_each_text_once():
+    tokenizer = CountingTokenizer()
+    cache = OrderedDict()
+
+    assert _count_tokens(["a b", "c", "a b", "d e f"], tokenizer, cache) == [2, 1, 2, 3]
+    assert tokenizer.encoded == ["a b", "c", "d e f"]
+
+    assert _count_tokens(["c", "g h", "a b", "g h"], tokenizer, cache) == [1, 2, 2, 2]
+    assert tokenizer.encoded == ["a b", "c", "d e f", "g h"]
+
+def test_count_tokens_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(pipeline.main, "TOKEN_CACHE_SIZE", 3)
+    tokenizer = CountingTokenizer()
+    cache = OrderedDict()
+
+    assert _count_tokens(["a", "b c", "d e f"], tokenizer, cache) == [1, 2, 3]
+    # Reusing "a" makes "b c" the least recently used entry, so adding "g" evicts it
+    assert _count_tokens(["a", "g"], tokenizer, cache) == [1, 1]
+    assert len(cache) == 3
+
+    tokenizer.encoded.clear()
+    assert _count_tokens(["b c", "a", "d e f"], tokenizer, cache) == [2, 1, 3]
+    assert tokenizer.encoded == ["b c"]
+    assert len(cache) <= 3
+
+def test_count_tokens_batch_larger_than_cache(monkeypatch):
+    monkeypatch.setattr(pipeline.main, "TOKEN_CACHE_SIZE", 2)
+    cache = OrderedDict()
+
+    # Eviction runs after the batch is resolved, so every count is still returned
+    assert _count_tokens(["a", "b c", "d e f", "a"], CountingTokenizer(), cache) == [1, 2, 3, 1]
+    assert len(cache) <= 2
+
+class RecordingOutput:
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+
+def test_write_stage_flushes_at_buffer_size(monkeypatch):
+    monkeypatch.setattr(pipeline.main, "WRITE_BUFFER_SIZE", 100)
+    in_q = queue.Queue()
+    in_q.put(["x" * 40] * 10)
+    in_q.put(pipeline.main._DONE)
+    out_f = RecordingOutput()
+
+    pipeline.main._write_stage(out_f, in_q, threading.Event())
+
+    line = json.dumps({"text": "x" * 40}, separators=(",", ":")).encode() + b"\n"
+    assert b"".join(out_f.writes) == line * 10
+    # Flushed as soon as the buffer reaches the limit, not once per batch
+    assert all(len(data) < 100 + len(line) for data in out_f.writes)
+    assert len(out_f.writes) > 1
+
+class InlineExecutor:
+    """Runs submitted calls immediately, recording how the pool was sized."""
+
+    instances = []
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        InlineExecutor.instances.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+@pytest.mark.parametrize("num_files, expected_workers, expected_threads", [
+    (1, 1, 16),
+    (4, 4, 4),
+    (32, 16, 1),
+])
+def test_process_all_splits_cpus_between_workers(tmp_path: Path, monkeypatch, num_files, expected_workers, expected_threads):
+    in_dir = tmp_path / "raw"
+    in_dir.mkdir()
+    for i in range(num_files):
+        write_jsonl(in_dir / f"data{i}.jsonl", ROWS)
+
+    calls = []
+    monkeypatch.setattr(pipeline.main.os, "cpu_count", lambda: 16)
+    monkeypatch.setattr(pipeline.main, "ProcessPoolExecutor", InlineExecutor)
+    monkeypatch.setattr(pipeline.main, "process_file", lambda *args, **kwargs: calls.append(kwargs) or True)
+    InlineExecutor.instances.clear()
+
+    process_all(in_dir, tmp_path / "processed")
+
+    assert [executor.max_workers for executor in InlineExecutor.instances] == [expected_workers]
+    assert calls == [{"num_threads": expected_threads}] * num_files
+
+class FakeSession:
+    instances = []
+
+    def __init__(self):
+        self.closed = False
+        FakeSession.instances.append(self)
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def manifest(tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    datasets = [{"url": f"https://example.com/data{i}.jsonl", "filename": f"data{i}.jsonl"} for i in range(20)]
+    (tmp_path / "manifests").mkdir()
+    (tmp_path / "manifests" / "datasets.json").write_text(json.dumps({"datasets": datasets}), encoding="utf-8")
+    monkeypatch.setattr(pipeline.main.requests, "Session", FakeSession)
+    FakeSession.instances.clear()
+    return datasets
+
+def test_download_all_reuses_one_session_per_thread(manifest, monkeypatch):
+    calls = []
+
+    def fake_download(url, dest, expected_blake3=None, session=None):
+        calls.append((url, session, threading.get_ident()))
+        if url.endswith("data3.jsonl"):
+            raise OSError("connection reset")
+
+    monkeypatch.setattr(pipeline.main, "download_dataset", fake_download)
+
+    pipeline.main.download_all(max_workers=4)
+
+    assert sorted(url for url, _, _ in calls) == sorted(dataset["url"] for dataset in manifest)
+    sessions_by_thread = {}
+    for _, session, thread_id in calls:
+        sessions_by_thread.setdefault(thread_id, set()).add(session)
+    assert all(len(sessions) == 1 for sessions in sessions_by_thread.values())
+    assert len(FakeSession.instances) == len(sessions_by_thread)
+    assert all(session.closed for session in FakeSession.instances)
+
+def test_download_all_closes_sessions_on_error(manifest, monkeypatch):
+    def failing_entry(dataset, session):
+        raise RuntimeError("unexpected failure")
+
+    monkeypatch.setattr(pipeline.main, "_download_entry", failing_entry)
+
+    with pytest.raises(RuntimeError):
+        pipeline.main.download_all(max_workers=4)
+
+    assert FakeSession.instances
+    assert all(session.closed for session in FakeSession.instances)